@@ -50,19 +50,36 @@ p = 0.2
 
 
 
-import numpy as np
+import math
+from functools import lru_cache
+
 from qiskit.circuit import QuantumCircuit
+from qiskit.circuit.library import RYGate
 
 
-class BernoulliA(QuantumCircuit):
-    """A circuit representing the Bernoulli A operator."""
+@lru_cache(maxsize=None)
+def bernoulli_theta(probability):
+    """The rotation angle theta_p = 2 * arcsin(sqrt(p)) shared by A and Q."""
+    return 2 * math.asin(math.sqrt(probability))
 
-    def __init__(self, probability):
-        super().__init__(1)  # circuit on 1 qubit
 
-        theta_p = 2 * np.arcsin(np.sqrt(probability))
-        self.ry(theta_p, 0)
+@lru_cache(maxsize=None)
+def _q_power(k, theta_p):
+    # Q^k = R_Y(2k theta_p) in closed form: one RY gate, built once per k
+    q_k = QuantumCircuit(1)
+    q_k.append(RYGate(2 * k * theta_p), [0])
+    return q_k
+
 
+def bernoulli_a(probability):
+    """Return a circuit representing the Bernoulli A operator."""
+    a = QuantumCircuit(1)  # circuit on 1 qubit
+    a.ry(bernoulli_theta(probability), 0)
+    return a
+
+
+# Q stays a `QuantumCircuit` subclass: the AE algorithms call `power` on the Grover operator,
+# so this is where the efficient power of Q is plugged in.
 
 class BernoulliQ(QuantumCircuit):
     """A circuit representing the Bernoulli Q operator."""
@@ -70,20 +87,24 @@ class BernoulliQ(QuantumCircuit):
     def __init__(self, probability):
         super().__init__(1)  # circuit on 1 qubit
 
-        self._theta_p = 2 * np.arcsin(np.sqrt(probability))
+        self._theta_p = bernoulli_theta(probability)
         self.ry(2 * self._theta_p, 0)
 
     def power(self, k):
-        # implement the efficient power of Q
-        q_k = QuantumCircuit(1)
-        q_k.ry(2 * k * self._theta_p, 0)
-        return q_k
+        # implement the efficient power of Q; the AE algorithms only read the returned
+        # circuit, so the cached one is handed out as is
+        return _q_power(k, self._theta_p)
+
 
+@lru_cache(maxsize=None)
+def build_bernoulli_operators(probability):
+    """Return the A and Q operators for ``probability``, built once per probability."""
+    return bernoulli_a(probability), BernoulliQ(probability)
 
 
 
-A = BernoulliA(p)
-Q = BernoulliQ(p)
+
+A, Q = build_bernoulli_operators(p)
 
 
 # ### Amplitude Estimation workflow
@@ -103,12 +124,31 @@ problem = EstimationProblem(
 )
 
 
-# To execute circuits we'll use `Sampler`.
+# To execute circuits we'll use the `Sampler` of Qiskit Aer, which evaluates the circuits with Aer's C++ simulator. Setting `shots` to `None` returns the exact probabilities.
+
+
+from qiskit_aer.primitives import Sampler
+from qiskit_aer.backends.backend_utils import available_devices
+from qiskit_aer.backends.controller_wrappers import aer_controller_execute
+
+
+# Below this width the statevector is too small to amortize moving it to the GPU
+GPU_MIN_QUBITS = 20
+
 
+@lru_cache(maxsize=None)
+def _get_sampler(num_qubits):
+    """Return the sampler for circuits on ``num_qubits`` qubits, created once per width."""
+    backend_options = {}
+    # only large instances go to the GPU, and only if this Aer build has one
+    if num_qubits >= GPU_MIN_QUBITS and "GPU" in available_devices(aer_controller_execute()):
+        backend_options["device"] = "GPU"
+    return Sampler(backend_options=backend_options, run_options={"shots": None})
 
-from qiskit.primitives import Sampler
 
-sampler = Sampler()
+# the AE circuit adds its evaluation qubits to the qubits of A
+num_eval_qubits = 3
+sampler = _get_sampler(num_eval_qubits + problem.state_preparation.num_qubits)
 
 
 # ### Canonical AE
@@ -119,7 +159,7 @@ sampler = Sampler()
 from amplitude_estimation_class import AmplitudeEstimation
 
 ae = AmplitudeEstimation(
-    num_eval_qubits=3,  # the number of evaluation qubits specifies circuit width and accuracy
+    num_eval_qubits=num_eval_qubits,  # the number of evaluation qubits specifies circuit width and accuracy
     sampler=sampler,
 )
 
@@ -166,7 +206,7 @@ print(ae_result.estimation)
 print("Interpolated MLE estimator:", ae_result.mle)
 
 
-# We can have a look at the circuit that AE executes:
+# We can have a look at the circuit that AE executes. All controlled powers $\mathcal{Q}^{2^j}$ of the phase estimation live in this single circuit, so `estimate` evaluates it with one sampler call and there is no per-power submission to batch:
 
 # Note: uncomment the following lines to learn more about the circuit
 # -------------------------------------------------------------------
@@ -312,27 +312,38 @@ class IterativeAmplitudeEstimation(AmplitudeEstimator):
             ratios.append((2 * powers[-1] + 1) / (2 * powers[-2] + 1))
 
             # run measurements for Q^k A|0> circuit
-            circuit = self.construct_circuit(estimation_problem, k, measurement=True)
+            circuits = [self.construct_circuit(estimation_problem, k, measurement=True)]
+            if num_iterations == 1 and getattr(self._sampler.options, "shots", None) is None:
+                # an exact sampler only needs the A|0> circuit, so it is submitted in the same
+                # job as the first Q^k A|0> circuit instead of in a second round-trip
+                circuits.append(self.construct_circuit(estimation_problem, k=0, measurement=True))
             counts = {}
 
             try:
-                job = self._sampler.run([circuit])
+                job = self._sampler.run(circuits)
                 ret = job.result()
             except Exception as exc:
                 raise AlgorithmError("The job was not completed successfully. ") from exc
 
             shots = ret.metadata[0].get("shots")
             if shots is None:
-                circuit = self.construct_circuit(estimation_problem, k=0, measurement=True)
-                try:
-                    job = self._sampler.run([circuit])
-                    ret = job.result()
-                except Exception as exc:
-                    raise AlgorithmError("The job was not completed successfully. ") from exc
+                if len(circuits) == 1:
+                    # the sampler options did not tell that it is exact, so the A|0> circuit
+                    # was not part of the first job
+                    circuit = self.construct_circuit(estimation_problem, k=0, measurement=True)
+                    try:
+                        job = self._sampler.run([circuit])
+                        ret = job.result()
+                    except Exception as exc:
+                        raise AlgorithmError("The job was not completed successfully. ") from exc
+                    circuits.append(circuit)
+                    quasi_dist = ret.quasi_dists[0]
+                else:
+                    quasi_dist = ret.quasi_dists[1]
 
                 # calculate the probability of measuring '1'
                 prob = 0.0
-                for bit, probabilities in ret.quasi_dists[0].binary_probabilities().items():
+                for bit, probabilities in quasi_dist.binary_probabilities().items():
                     # check if it is a good state
                     if estimation_problem.is_good_state(bit):
                         prob += probabilities
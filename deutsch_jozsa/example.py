@@ -203,15 +203,26 @@ r"""
 # We now implement the Deutsch-Jozsa algorithm for the example of a three-bit function, with both constant and balanced oracles. First let's do our imports:
 
 # initialization
+import os
+from functools import lru_cache
+
 import numpy as np
 
 # importing Qiskit
 from qiskit_aer import AerSimulator
-from qiskit import QuantumCircuit, transpile
+from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister, transpile
 
 # import basic plot tools
 from qiskit.visualization import plot_histogram
 
+# random number generator used to pick the oracles
+_rng = np.random.default_rng()
+
+# One local simulator, configured once and shared by every run below. The D-J circuits only
+# contain Clifford gates (H, X, CX) and measurements, so the stabilizer method simulates them in
+# polynomial instead of exponential time and memory.
+aer_sim = AerSimulator(method="stabilizer", max_parallel_threads=os.cpu_count(), shots=1024)
+
 # ### 4.1 Constant Oracle <a id='const_oracle'></a>
 # Let's start by creating a constant oracle, in this case the input has no effect on the output so we just randomly set the output qubit to be 0 or 1:
 
@@ -220,7 +231,7 @@ n = 3
 
 const_oracle = QuantumCircuit(n+1)
 
-output = np.random.randint(2)
+output = _rng.integers(2)
 if output == 1:
     const_oracle.x(n)
 
@@ -230,6 +241,9 @@ if output == 1:
 
 # ### 4.2 Balanced Oracle <a id='balanced_oracle'></a>
 
+# The circuits below use barriers only to divide their parts when they are drawn. A barrier is a real instruction that stops the transpiler from cancelling or fusing gates across it, so they are only added when `DEBUG_DRAW` is set:
+
+DEBUG_DRAW = False
 
 balanced_oracle = QuantumCircuit(n+1)
 
@@ -245,9 +259,7 @@ balanced_oracle = QuantumCircuit(n+1)
 b_str = "101"
 
 # Place X-gates
-for qubit in range(len(b_str)):
-    if b_str[qubit] == '1':
-        balanced_oracle.x(qubit)
+balanced_oracle.x([qubit for qubit, digit in enumerate(b_str) if digit == '1'])
 
 # You can draw the circuit by uncommenting the following line:
 # balanced_oracle.draw()
@@ -259,45 +271,42 @@ balanced_oracle = QuantumCircuit(n+1)
 b_str = "101"
 
 # Place X-gates
-for qubit in range(len(b_str)):
-    if b_str[qubit] == '1':
-        balanced_oracle.x(qubit)
+balanced_oracle.x([qubit for qubit, digit in enumerate(b_str) if digit == '1'])
 
-# Use barrier as divider
-balanced_oracle.barrier()
+# Use barrier as divider (only when drawing)
+if DEBUG_DRAW:
+    balanced_oracle.barrier()
 
 # Controlled-NOT gates
-for qubit in range(n):
-    balanced_oracle.cx(qubit, n)
+balanced_oracle.cx(list(range(n)), [n]*n)
 
-balanced_oracle.barrier()
+if DEBUG_DRAW:
+    balanced_oracle.barrier()
 # You can draw the circuit by uncommenting the following line:
 # balanced_oracle.draw()
 
 
-# Finally, we repeat the code from two cells up to finish wrapping the controls in X-gates:
+# Finally, we repeat the code from two cells up to finish wrapping the controls in X-gates. Both X-gate layers act on the same qubits, so we find them once and reuse the list:
 
 balanced_oracle = QuantumCircuit(n+1)
 b_str = "101"
+xs = np.flatnonzero(np.frombuffer(b_str.encode(), dtype=np.uint8) == ord('1')).tolist()
 
 # Place X-gates
-for qubit in range(len(b_str)):
-    if b_str[qubit] == '1':
-        balanced_oracle.x(qubit)
+balanced_oracle.x(xs)
 
-# Use barrier as divider
-balanced_oracle.barrier()
+# Use barrier as divider (only when drawing)
+if DEBUG_DRAW:
+    balanced_oracle.barrier()
 
 # Controlled-NOT gates
-for qubit in range(n):
-    balanced_oracle.cx(qubit, n)
+balanced_oracle.cx(list(range(n)), [n]*n)
 
-balanced_oracle.barrier()
+if DEBUG_DRAW:
+    balanced_oracle.barrier()
 
 # Place X-gates
-for qubit in range(len(b_str)):
-    if b_str[qubit] == '1':
-        balanced_oracle.x(qubit)
+balanced_oracle.x(xs)
 
 # Show oracle
 # You can draw the circuit by uncommenting the following line:
@@ -313,8 +322,7 @@ for qubit in range(len(b_str)):
 dj_circuit = QuantumCircuit(n+1, n)
 
 # Apply H-gates
-for qubit in range(n):
-    dj_circuit.h(qubit)
+dj_circuit.h(range(n))
 
 # Put qubit in state |->
 dj_circuit.x(n)
@@ -328,8 +336,7 @@ dj_circuit.h(n)
 dj_circuit = QuantumCircuit(n+1, n)
 
 # Apply H-gates
-for qubit in range(n):
-    dj_circuit.h(qubit)
+dj_circuit.h(range(n))
 
 # Put qubit in state |->
 dj_circuit.x(n)
@@ -347,8 +354,7 @@ dj_circuit = dj_circuit.compose(balanced_oracle)
 dj_circuit = QuantumCircuit(n+1, n)
 
 # Apply H-gates
-for qubit in range(n):
-    dj_circuit.h(qubit)
+dj_circuit.h(range(n))
 
 # Put qubit in state |->
 dj_circuit.x(n)
@@ -358,20 +364,18 @@ dj_circuit.h(n)
 dj_circuit = dj_circuit.compose(balanced_oracle)
 
 # Repeat H-gates
-for qubit in range(n):
-    dj_circuit.h(qubit)
-dj_circuit.barrier()
+dj_circuit.h(range(n))
+if DEBUG_DRAW:
+    dj_circuit.barrier()
 
 # Measure
-for i in range(n):
-    dj_circuit.measure(i, i)
+dj_circuit.measure(range(n), range(n))
 
 
 # Let's see the output:
 
 
-# use local simulator
-aer_sim = AerSimulator()
+# use the local simulator set up with the imports
 results = aer_sim.run(dj_circuit).result()
 answer = results.get_counts()
 
@@ -381,89 +385,244 @@ print(answer)
 # plot_histogram(answer)
 
 # ...we have a 0% chance of measuring 000. 
-assert answer.get('000', 0) == 0
+ZERO = '0'*n
+assert answer.get(ZERO, 0) == 0
 
 
 # We can see from the results above that we have a 0% chance of measuring `000`. This correctly predicts the function is balanced. 
 # 
 # ### 4.4 Generalised Circuits <a id='general_circs'></a>
 # 
-# Below, we provide a generalised function that creates Deutsch-Jozsa oracles and turns them into quantum gates. It takes the `case`, (either `'balanced'` or '`constant`', and `n`, the size of the input register:
+# Below, we provide a generalised function that creates Deutsch-Jozsa oracles as quantum circuits. The oracle is only a handful of $X$ and $CX$ gates, so it is composed into the algorithm as is rather than wrapped into an opaque gate, which would only have to be unrolled again by the transpiler. It takes the `case`, (either `'balanced'` or '`constant`', and `n`, the size of the input register:
 
+# The circuits built by these functions all share one quantum and one classical register per size `n`, created once, instead of allocating fresh registers for every circuit:
 
-def dj_oracle(case, n):
+@lru_cache(maxsize=None)
+def _registers(n):
+    return QuantumRegister(n+1, 'q'), ClassicalRegister(n, 'c')
+
+
+def dj_oracle(case, n, b_str=None, output=None):
     # We need to make a QuantumCircuit object to return
     # This circuit has n+1 qubits: the size of the input,
     # plus one output qubit
-    oracle_qc = QuantumCircuit(n+1)
+    oracle_qc = QuantumCircuit(_registers(n)[0])
     
     # First, let's deal with the case in which oracle is balanced
     if case == "balanced":
-        # First generate a random number that tells us which CNOTs to
-        # wrap in X-gates:
-        b = np.random.randint(1,2**n)
-        # Next, format 'b' as a binary string of length 'n', padded with zeros:
-        b_str = format(b, '0'+str(n)+'b')
+        # Unless the caller fixed which CNOTs to wrap in X-gates, pick them at random
+        if b_str is None:
+            # First generate a random number that tells us which CNOTs to
+            # wrap in X-gates:
+            b = _rng.integers(1, 1<<n)
+            # Next, format 'b' as a binary string of length 'n', padded with zeros:
+            b_str = f"{b:0{n}b}"
         # Next, we place the first X-gates. Each digit in our binary string 
         # corresponds to a qubit, if the digit is 0, we do nothing, if it's 1
         # we apply an X-gate to that qubit:
-        for qubit in range(len(b_str)):
-            if b_str[qubit] == '1':
-                oracle_qc.x(qubit)
+        xs = np.flatnonzero(np.frombuffer(b_str.encode(), dtype=np.uint8) == ord('1')).tolist()
+        if xs:
+            oracle_qc.x(xs)
         # Do the controlled-NOT gates for each qubit, using the output qubit 
         # as the target:
-        for qubit in range(n):
-            oracle_qc.cx(qubit, n)
+        oracle_qc.cx(list(range(n)), [n]*n)
         # Next, place the final X-gates
-        for qubit in range(len(b_str)):
-            if b_str[qubit] == '1':
-                oracle_qc.x(qubit)
+        if xs:
+            oracle_qc.x(xs)
 
     # Case in which oracle is constant
     if case == "constant":
         # First decide what the fixed output of the oracle will be
-        # (either always 0 or always 1)
-        output = np.random.randint(2)
+        # (either always 0 or always 1), unless the caller fixed it
+        if output is None:
+            output = _rng.integers(2)
         if output == 1:
             oracle_qc.x(n)
     
-    oracle_gate = oracle_qc.to_gate()
-    oracle_gate.name = "Oracle" # To show when we display the circuit
-    return oracle_gate
-
-
-# Let's also create a function that takes this oracle gate and performs the Deutsch-Jozsa algorithm on it:
-
-def dj_algorithm(oracle, n):
-    dj_circuit = QuantumCircuit(n+1, n)
-    # Set up the output qubit:
-    dj_circuit.x(n)
-    dj_circuit.h(n)
-    # And set up the input register:
-    for qubit in range(n):
-        dj_circuit.h(qubit)
-    # Let's append the oracle gate to our circuit:
-    dj_circuit.append(oracle, range(n+1))
+    oracle_qc.name = "Oracle" # To show when we display the circuit
+    return oracle_qc
+
+
+# Let's also create a function that takes this oracle circuit and performs the Deutsch-Jozsa algorithm on it. The state after the preparation steps is known analytically, so when simulating with Aer's statevector method, `set_initial_state=True` loads it directly instead of simulating the preparation gates (this is not supported by the stabilizer method used below, where those gates are cheap anyway):
+
+def dj_initial_state(n):
+    # The preparation steps always produce the product state |+>^n |->: every amplitude
+    # has magnitude 2^(-(n+1)/2), and it is negative whenever the output qubit n (the
+    # most significant bit of the index) is 1
+    psi0 = np.full(1<<(n+1), 2**(-(n+1)/2), dtype=np.complex128)
+    psi0[1<<n:] *= -1
+    return psi0
+
+
+def dj_algorithm(oracle, n, set_initial_state=False):
+    dj_circuit = QuantumCircuit(*_registers(n))
+    if set_initial_state:
+        # On Aer's statevector method, the prepared state can be written directly
+        # into the simulator instead of being evolved through the X and H gates
+        dj_circuit.set_statevector(dj_initial_state(n))
+    else:
+        # Set up the output qubit:
+        dj_circuit.x(n)
+        dj_circuit.h(n)
+        # And set up the input register:
+        dj_circuit.h(range(n))
+    # Let's compose the oracle into our circuit:
+    dj_circuit.compose(oracle, qubits=range(n+1), inplace=True)
     # Finally, perform the H-gates again and measure:
-    for qubit in range(n):
-        dj_circuit.h(qubit)
+    dj_circuit.h(range(n))
     
-    for i in range(n):
-        dj_circuit.measure(i, i)
+    dj_circuit.measure(range(n), range(n))
     
     return dj_circuit
 
 
+# Transpiling dominates the run time for circuits this small, and the circuit only depends on the oracle. So we memoize the transpiled circuit per oracle: running the same oracle again hands the cached circuit straight to the simulator. The oracle has to be fully specified (`b_str` for a balanced oracle, `output` for a constant one) so that the cached circuit is the one asked for.
+
+@lru_cache(maxsize=None)
+def _get_transpiled(case, n, b_str=None, output=None):
+    # A random oracle would be drawn once and then cached, so every later call would get that same one
+    if case == "balanced" and b_str is None:
+        raise ValueError("a balanced oracle needs b_str to be cached")
+    if case == "constant" and output is None:
+        raise ValueError("a constant oracle needs output to be cached")
+    oracle = dj_oracle(case, n, b_str=b_str, output=output)
+    dj_circuit = dj_algorithm(oracle, n)
+    return transpile(dj_circuit, aer_sim)
+
+
 # Finally, let's use these functions to play around with the algorithm:
 
 n = 4
-oracle_gate = dj_oracle('balanced', n)
-dj_circuit = dj_algorithm(oracle_gate, n)
+b_str = f"{_rng.integers(1, 1<<n):0{n}b}"
 
-transpiled_dj_circuit = transpile(dj_circuit, aer_sim)
+transpiled_dj_circuit = _get_transpiled('balanced', n, b_str)
 results = aer_sim.run(transpiled_dj_circuit).result()
 answer = results.get_counts()
 print(answer)
 
 # We can plot the results using the plot_histogram function:
 # plot_histogram(answer)
+
+
+# We can also check every oracle of this size at once. Instead of one `run` call per oracle, all circuits are transpiled together and submitted to the simulator as a single batch, so the per-call setup is only paid once:
+
+b_strs = [f"{b:0{n}b}" for b in range(1, 1<<n)]
+circuits = [dj_algorithm(dj_oracle('balanced', n, b_str=b), n) for b in b_strs]
+circuits += [dj_algorithm(dj_oracle('constant', n, output=output), n) for output in (0, 1)]
+
+results = aer_sim.run(transpile(circuits, aer_sim)).result()
+answers = [results.get_counts(i) for i in range(len(circuits))]
+
+# ...balanced oracles never give 0000, constant ones always do. The all-zero counts of every oracle are gathered into one array and checked at once.
+ZERO = '0'*n
+zero_counts = np.fromiter((answer.get(ZERO, 0) for answer in answers), dtype=np.int64, count=len(answers))
+assert not zero_counts[:len(b_strs)].any()
+assert (zero_counts[len(b_strs):] == 1024).all()
+
+
+# For larger sweeps the oracles can also be run concurrently from a pool of workers, each building and running the oracles it is handed. The circuits only contain $H$, $X$, $CX$ and measurements, which the stabilizer simulator runs natively, so the workers skip transpilation (it costs far more than the simulation at this size). We use threads rather than processes, following the strategy in the README: Aer releases the GIL while it simulates, forking a process after Aer has already run in this script can deadlock its OpenMP runtime, and spawned processes would re-run this unguarded script. The stabilizer simulator is created once per worker thread by the pool initializer:
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+_worker = threading.local()
+
+
+def _init_worker():
+    _worker.sim = AerSimulator(method="stabilizer", max_parallel_threads=1)
+
+
+def run_one(n, b_str):
+    dj_circuit = dj_algorithm(dj_oracle('balanced', n, b_str=b_str), n)
+    return _worker.sim.run(dj_circuit, shots=1024).result().get_counts()
+
+
+with ThreadPoolExecutor(max_workers=os.cpu_count(), initializer=_init_worker) as executor:
+    sweep = list(executor.map(partial(run_one, n), b_strs))
+
+# ...the parallel sweep classifies every balanced oracle just like the batched run.
+assert all(answer.get(ZERO, 0) == 0 for answer in sweep)
+
+
+# For algorithmic experiments on a statevector simulator, the oracle does not have to be built from gates at all. Through phase kickback it only multiplies each input $|x\rangle$ by $(-1)^{f(x)}$, so we can write this diagonal down directly and hand it to Aer as a single `DiagonalGate` on the input qubits, which Aer applies as one elementwise multiply over the statevector. For the balanced oracle built from `b_str`, $f(x)$ is the parity of $x \oplus b$, where the digit of `b_str` at position $i$ sets bit $i$ of $b$. The diagonal gate is not a Clifford instruction, so this needs the statevector method:
+
+from qiskit.circuit.library import DiagonalGate
+
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    # NumPy < 2 has no popcount ufunc, so the bits of each byte are unpacked and counted
+    def _popcount(a):
+        a = np.asarray(a, dtype=np.uint64)
+        return np.unpackbits(a.reshape(*a.shape, 1).view(np.uint8), axis=-1).sum(axis=-1)
+
+
+def dj_phase_oracle(case, n, b_str=None, output=None):
+    oracle_qc = QuantumCircuit(_registers(n)[0])
+    if case == "balanced":
+        if b_str is None:
+            b_str = f"{_rng.integers(1, 1<<n):0{n}b}"
+        b = int(b_str[::-1], 2)
+        diagonal = np.where(_popcount(np.arange(1<<n) ^ b) & 1, -1.0, 1.0)
+    if case == "constant":
+        if output is None:
+            output = _rng.integers(2)
+        diagonal = np.full(1<<n, -1.0 if output == 1 else 1.0)
+    oracle_qc.append(DiagonalGate(diagonal.tolist()), range(n))
+    oracle_qc.name = "Oracle"
+    return oracle_qc
+
+
+sv_sim = AerSimulator(method="statevector", max_parallel_threads=os.cpu_count(), shots=1024)
+phase_dj_circuit = dj_algorithm(dj_phase_oracle('balanced', n, b_str), n)
+results = sv_sim.run(transpile(phase_dj_circuit, sv_sim)).result()
+
+# ...the phase oracle gives the same answer as the gate-based one.
+assert results.get_counts() == answer
+
+
+# ### 4.5 Classical Verification <a id='classical_verification'></a>
+#
+# Since the oracle only multiplies each input $|x\rangle$ by the phase $(-1)^{f(x)}$, the two Hadamard layers around it turn the whole algorithm into a Walsh-Hadamard transform of the sign vector $(-1)^{f(x)}$ (see step 4 in section 1.3). For verification we can compute this transform classically with the fast Walsh-Hadamard transform in $O(n 2^n)$ operations, without simulating any gates. The transform lives in `fwht.py`, which compiles it with Numba when it is installed:
+
+from fwht import fwht
+
+
+def dj_classical_fast(f_values):
+    # amplitudes of the input register after the algorithm, given the signs (-1)^f(x)
+    return fwht(np.array(f_values, dtype=np.float64)) / len(f_values)
+
+
+# The signs are the same diagonal the phase oracle above applies:
+
+b = int(b_str[::-1], 2)
+f_values = np.where(_popcount(np.arange(1<<n) ^ b) & 1, -1.0, 1.0)
+amplitudes = dj_classical_fast(f_values)
+
+# The transform puts all of the probability on a single outcome, the same one the simulator measured:
+outcome = int(np.argmax(amplitudes**2))
+assert amplitudes[0] == 0
+assert answer == {f"{outcome:0{n}b}": 1024}
+
+
+# The same transform can stand in for the last step of the circuit: the final layer of Hadamards followed by a computational-basis measurement is a measurement in the $X$ basis. On the statevector simulator we can therefore stop right after the oracle, save the state, and apply the Hadamard layer classically instead of simulating it:
+
+def dj_statevector_probabilities(oracle, n, simulator):
+    dj_circuit = QuantumCircuit(_registers(n)[0])
+    dj_circuit.x(n)
+    dj_circuit.h(range(n+1))
+    dj_circuit.compose(oracle, qubits=range(n+1), inplace=True)
+    dj_circuit.save_statevector()
+    psi = simulator.run(transpile(dj_circuit, simulator)).result().get_statevector()
+    # The output qubit (the most significant bit) is left in |->, so the first half of the
+    # vector is the input register scaled by 1/sqrt(2). Its amplitudes are real here.
+    register = np.sqrt(2) * np.asarray(psi)[:1<<n].real
+    return (fwht(register) / np.sqrt(1<<n))**2
+
+
+probabilities = dj_statevector_probabilities(dj_phase_oracle('balanced', n, b_str), n, sv_sim)
+
+# ...this matches the transform of the sign vector computed above.
+assert np.allclose(probabilities, amplitudes**2)
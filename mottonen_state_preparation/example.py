@@ -6,16 +6,26 @@ from qiskit_aer import AerSimulator
 from MottonenStatePreparation import state_prep_möttönen
 
 vector = [-0.1, 0.2, -0.3, 0.4, -0.5, 0.6, -0.7, 0.8]
-vector = np.asarray(vector)
-vector = (1 / np.linalg.norm(vector)) * vector
+vector = np.asarray(vector, dtype=np.float64)
+vector /= np.linalg.norm(vector)
 
-qubits = int(np.log2(len(vector)))
+size = len(vector)
+assert size & (size - 1) == 0, "the vector length must be a power of two"
+qubits = size.bit_length() - 1
 reg = QuantumRegister(qubits, "reg")
 c = ClassicalRegister(qubits, "c")
 qc = QuantumCircuit(reg, c, name='state prep')
-state_prep_möttönen(qc, vector, reg)
 
-qc = qc.decompose(reps=2)
+# If the circuit is only going to be run on Aer, the amplitudes can be written straight
+# into the simulator instead of building the Möttönen tree of controlled rotations.
+# Keep this off to get the gate-level state preparation, e.g. for running on hardware.
+backend_is_aer = False
 
-# You can draw the circuit by uncommenting the following line:
-# qc.draw()
+if backend_is_aer:
+    qc.set_statevector(vector)
+else:
+    state_prep_möttönen(qc, vector, reg)
+
+# The composite gates are left as they are: transpiling for a backend unrolls them anyway.
+# You can draw the unrolled circuit by uncommenting the following line:
+# qc.decompose(reps=2).draw()
@@ -437,7 +437,7 @@ import numpy as np
 from numpy import pi
 # importing Qiskit
 from qiskit import QuantumCircuit
-from qiskit_aer import AerSimulator
+from qiskit.quantum_info import Statevector
 
 # Uncomment the following line for visualization
 from qiskit.visualization import plot_histogram, plot_bloch_multivector
@@ -447,20 +447,24 @@ from qiskit.visualization import plot_histogram, plot_bloch_multivector
 # 
 # We will now create a general circuit for the QFT in Qiskit. Creating large general circuits like this is really where Qiskit shines. 
 # 
-# It is easier to build a circuit that implements the QFT with the qubits upside down, then swap them afterwards; we will start off by creating the function that rotates our qubits correctly. We need to correctly rotate the second most significant qubit. Then we must deal with the third most significant, and so on. When we get to the end of our `qft_rotations()` function, we can use the same code to repeat the process on the next `n-1` qubits:
+# It is easier to build a circuit that implements the QFT with the qubits upside down, then swap them afterwards; we will start off by creating the function that rotates our qubits correctly. We need to correctly rotate the second most significant qubit. Then we must deal with the third most significant, and so on. When we are done with one qubit, we repeat the same process on the next `n-1` qubits:
 
 
-def qft_rotations(circuit, n):
-    """Performs qft on the first n qubits in circuit (without swaps)"""
-    if n == 0:
-        return circuit
-    n -= 1
-    circuit.h(n)
-    for qubit in range(n):
-        circuit.cp(pi/2**(n-qubit), qubit, n)
-    # At the end of our function, we call the same function again on
-    # the next qubits (we reduced n by one earlier in the function)
-    qft_rotations(circuit, n)
+# the rotation angles pi/2**k only depend on the distance k between the qubits,
+# so they are computed once for every circuit we build
+_QFT_ANGLES = [pi/(1 << k) for k in range(1, 64)]
+
+def qft_rotations(circuit, n, approximation_degree=0):
+    """Performs qft on the first n qubits in circuit (without swaps)
+
+    With approximation_degree > 0 that many smallest rotations of each qubit
+    are skipped, giving the approximate QFT (see section 7)"""
+    max_distance = n - 1 - approximation_degree
+    for target in range(n-1, -1, -1):
+        circuit.h(target)
+        for qubit in range(max(0, target - max_distance), target):
+            circuit.cp(_QFT_ANGLES[target-qubit-1], qubit, target)
+    return circuit
 
 # Let's see how it looks:
 qc = QuantumCircuit(4)
@@ -470,7 +474,9 @@ qft_rotations(qc,4)
 # qc.draw()
 
 
-# That was easy! Process in which a function calls itself directly or indirectly is called _recursion._ It can greatly simplify code.
+# Passing `approximation_degree=k` leaves out the rotations by the `k` smallest angles, which is the approximate QFT from section 7. It is the same convention as the `approximation_degree` of Qiskit's library [`QFT`](https://docs.quantum.ibm.com/api/qiskit/qiskit.circuit.library.QFT).
+
+# That was easy! Each pass of the outer loop is the same process on one less qubit, so `qft_rotations` could also call itself on the next `n-1` qubits, a technique called _recursion._ Writing it as a loop avoids building one Python call frame per qubit.
 
 # Finally, we need to add the swaps at the end of the QFT function to match the definition of the QFT. We will combine this into the final function `qft()`:
 
@@ -496,6 +502,19 @@ qft(qc,4)
 
 # This is the generalised circuit for the quantum Fourier transform.
 
+# Qiskit also ships this circuit as [`QFT`](https://docs.quantum.ibm.com/api/qiskit/qiskit.circuit.library.QFT) in its circuit library, with the approximation (`approximation_degree`) and the final swaps (`do_swaps`) as options. In practice you would usually use the library version; leaving out the swaps is useful when the qubit order can be reversed classically afterwards (see below). Decomposed, it gives the same gates as our `qft()`:
+
+from qiskit.circuit.library import QFT
+from qiskit.quantum_info import Operator
+
+def qft_library(circuit, n, approximation_degree=0, do_swaps=True):
+    """QFT on the first n qubits in circuit, using Qiskit's library circuit"""
+    circuit.compose(QFT(n, approximation_degree=approximation_degree, do_swaps=do_swaps).decompose(),
+                    range(n), inplace=True)
+    return circuit
+
+assert Operator(qft_library(QuantumCircuit(4), 4)).equiv(Operator(qc))
+
 
 # We now want to demonstrate this circuit works correctly. To do this we must first encode a number in the computational basis. We can see the number 5 in binary is `101`:
 
@@ -503,31 +522,27 @@ qft(qc,4)
 bin(5)
 
 
-# (The `0b` just reminds us this is a binary number). Let's encode this into our qubits:
+# (The `0b` just reminds us this is a binary number). Let's encode this into our qubits. We could flip qubits 0 and 2 with $X$ gates, but since we know the whole basis state we can also set it in one step with `initialize`:
 
 
 # Create the circuit
 qc = QuantumCircuit(3)
 
-# Encode the state 5
-qc.x(0)
-qc.x(2)
+# Encode the state 5 by setting the basis state directly
+encoded_state = Statevector.from_int(5, dims=2**3)
+qc.initialize(encoded_state, range(3))
 
 # Uncomment the following line for drawing the circuit
 # qc.draw()
 
 
-# And let's check the qubit's states using the aer simulator:
-
+# And let's check the qubit's states. For a circuit this small we don't need a simulator backend: `Statevector.from_instruction` applies the circuit to the state directly with NumPy, without setting up and running an Aer job:
 
-sim = AerSimulator()
 
-qc_init = qc.copy()
-qc_init.save_statevector()
-statevector = sim.run(qc_init).result().get_statevector()
+initial_state = Statevector.from_instruction(qc)
 
 # Uncomment the following line for plotting the vector on the Bloch sphere
-# plot_bloch_multivector(statevector)
+# plot_bloch_multivector(initial_state)
 
 
 # Finally, let's use our QFT function and view the final state of our qubits:
@@ -539,14 +554,58 @@ qft(qc,3)
 # qc.draw()
 
 
-qc.save_statevector()
-statevector = sim.run(qc).result().get_statevector()
+statevector = Statevector.from_instruction(qc)
 print(statevector)
 
 # Uncomment the following line for plotting the vector on the Bloch sphere
 # plot_bloch_multivector(statevector)
 
 
+# The QFT is the discrete Fourier transform of the amplitudes, so when we only need the final state we don't have to apply the gates at all: a fast Fourier transform of the statevector takes $O(n2^n)$ operations, where the circuit applies $O(n^2)$ gates to all $2^n$ amplitudes. Note that with $\omega_N = e^{2\pi i/N}$ the QFT matches what NumPy calls the *inverse* FFT. The swaps don't need any special handling either: in Qiskit's little-endian ordering the FFT output already comes out in the order of the full circuit, swaps included:
+
+def qft_statevector(state):
+    """QFT of the amplitudes in state, computed with an FFT instead of gates"""
+    return np.fft.ifft(state, norm="ortho")
+
+assert np.allclose(qft_statevector(encoded_state.data), statevector)
+
+# The transform keeps the precision of its input. When single precision is accurate enough, e.g. when we only want to read off the most likely outcome, passing a `complex64` state halves the memory the FFT has to stream through:
+
+assert np.allclose(qft_statevector(encoded_state.data.astype(np.complex64)), statevector, atol=1e-6)
+
+# For large $n$ the statevector no longer fits in the CPU caches and the FFT is limited by memory bandwidth. If [CuPy](https://cupy.dev/) is installed, the same transform can run on the GPU with cuFFT. `qft_gpu` takes and returns a GPU array, so that a sweep of transforms can keep the state on the device between calls:
+
+try:
+    import cupy
+except ImportError:
+    cupy = None
+
+def qft_gpu(state):
+    """QFT of the amplitudes in state (a CuPy array), computed with cuFFT on the GPU"""
+    return cupy.fft.ifft(state, norm="ortho")
+
+if cupy is not None:
+    # keep the cuFFT plans of repeated transforms instead of planning each call again
+    cupy.fft.config.get_plan_cache().set_size(16)
+    assert np.allclose(cupy.asnumpy(qft_gpu(cupy.asarray(encoded_state.data))), statevector)
+
+# The swaps at the end of the circuit can be taken out of the simulation in the same way. All they do is reverse the order of the qubits, which permutes the amplitudes by bit-reversing their indices. Instead of $n/2$ SWAP gates that each go over the whole state, we can run the circuit without them and gather the amplitudes in bit-reversed order once, with the permutation from `qft_kernels.py`:
+
+from qft_kernels import bit_reversal_permutation
+
+qc_rotations = QuantumCircuit(3)
+qc_rotations.initialize(encoded_state, range(3))
+qft_rotations(qc_rotations, 3)
+rotated_state = Statevector.from_instruction(qc_rotations).data
+
+assert np.allclose(rotated_state[bit_reversal_permutation(3)], statevector)
+
+# If we do want to apply the gates of the circuit one by one, for example to check them, we can still skip the round trip through the simulator for every gate. `qft_kernels.py` applies the Hadamard, controlled-phase and swap gates of `qft()` directly to a NumPy statevector, compiled with Numba when it is installed:
+
+from qft_kernels import qft_kernels
+
+assert np.allclose(qft_kernels(encoded_state.data.copy()), statevector)
+
 # We can see out QFT function has worked correctly. Compared the state $|\widetilde{0}\rangle = |{+}{+}{+}\rangle$, Qubit 0 has been rotated by $\tfrac{5}{8}$ of a full turn, qubit 1 by $\tfrac{10}{8}$ full turns (equivalent to $\tfrac{1}{4}$ of a full turn), and qubit 2 by $\tfrac{20}{8}$ full turns (equivalent to $\tfrac{1}{2}$ of a full turn).
 
 # ## 9. References<a id="references"></a>
@@ -0,0 +1,151 @@
+"""Gate-by-gate QFT applied directly to a statevector.
+
+The Hadamard, controlled-phase and swap kernels are compiled with Numba when it is
+installed, so that the whole circuit runs in a single call into compiled code. Without
+Numba the same gates are applied with vectorized NumPy operations on a split
+real/imaginary layout of the state (``SoAStateVector``).
+"""
+
+import math
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+_SQRT1_2 = 1 / math.sqrt(2)
+
+# phase factors exp(i*pi/2**k) of the controlled rotations, indexed by the distance k
+# between control and target
+_QFT_PHASES = np.exp(1j * np.pi / 2.0**np.arange(64))
+
+
+class SoAStateVector:
+    """A statevector stored as separate float64 arrays of real and imaginary parts.
+
+    Multiplying by a phase then becomes plain real arithmetic on contiguous arrays,
+    without shuffling interleaved real/imaginary pairs.
+    """
+
+    __slots__ = ("re", "im", "n")
+
+    def __init__(self, state):
+        # view the interleaved complex128 array as (real, imag) pairs without copying it
+        pairs = np.ascontiguousarray(state, dtype=np.complex128).view(np.float64).reshape(-1, 2)
+        self.re = pairs[:, 0].copy()
+        self.im = pairs[:, 1].copy()
+        self.n = self.re.shape[0].bit_length() - 1
+
+    def to_complex(self):
+        state = np.empty(self.re.shape[0], dtype=np.complex128)
+        state.real = self.re
+        state.imag = self.im
+        return state
+
+    def h(self, target):
+        # butterfly between the halves of each block of size 2*stride, on both arrays
+        stride = 1 << target
+        for part in (self.re, self.im):
+            blocks = part.reshape(-1, 2, stride)
+            x = blocks[:, 0, :].copy()
+            blocks[:, 0, :] += blocks[:, 1, :]
+            blocks[:, 1, :] = x - blocks[:, 1, :]
+            blocks *= _SQRT1_2
+
+    def cp(self, control, target, phase):
+        # only the amplitudes with both bits set pick up the phase factor
+        indices = np.arange(self.re.shape[0])
+        both_set = np.flatnonzero((indices >> control) & (indices >> target) & 1)
+        c, s = phase.real, phase.imag
+        re, im = self.re[both_set], self.im[both_set]
+        self.re[both_set] = re*c - im*s
+        self.im[both_set] = re*s + im*c
+
+    def permute(self, perm):
+        self.re = self.re[perm]
+        self.im = self.im[perm]
+
+
+def bit_reversal_permutation(n):
+    """Indices 0...2**n-1 with their n bits reversed"""
+    if n == 0:
+        return np.zeros(1, dtype=np.int64)
+    # reverse all 64 bits of every index at once by swapping ever larger bit groups
+    # with masks and shifts, then drop the 64-n low bits that were the leading zeros
+    x = np.arange(1 << n, dtype=np.uint64)
+    for shift, mask in ((1, 0x5555555555555555), (2, 0x3333333333333333), (4, 0x0F0F0F0F0F0F0F0F),
+                        (8, 0x00FF00FF00FF00FF), (16, 0x0000FFFF0000FFFF), (32, 0x00000000FFFFFFFF)):
+        mask = np.uint64(mask)
+        shift = np.uint64(shift)
+        x = ((x >> shift) & mask) | ((x & mask) << shift)
+    return (x >> np.uint64(64 - n)).astype(np.int64)
+
+
+def _qft_numpy(state, n):
+    soa = SoAStateVector(state)
+    for target in range(n-1, -1, -1):
+        soa.h(target)
+        for qubit in range(target):
+            soa.cp(qubit, target, _QFT_PHASES[target-qubit])
+    # the swaps reverse the qubit order, i.e. bit-reverse the amplitude indices
+    soa.permute(bit_reversal_permutation(n))
+    state[:] = soa.to_complex()
+    return state
+
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _apply_h(state, target):
+        stride = 1 << target
+        for block in prange(state.shape[0] // (2 * stride)):
+            i = block * 2 * stride
+            for j in range(i, i + stride):
+                a = state[j]
+                b = state[j + stride]
+                state[j] = (a + b) * _SQRT1_2
+                state[j + stride] = (a - b) * _SQRT1_2
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _apply_cp(state, control, target, phase):
+        mask = (1 << control) | (1 << target)
+        for i in prange(state.shape[0]):
+            if i & mask == mask:
+                state[i] *= phase
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _apply_swap(state, qubit1, qubit2):
+        # each pair is visited once, from the index with qubit1 set and qubit2 clear
+        flip = (1 << qubit1) | (1 << qubit2)
+        for i in prange(state.shape[0]):
+            if (i >> qubit1) & 1 and not (i >> qubit2) & 1:
+                j = i ^ flip
+                state[i], state[j] = state[j], state[i]
+
+    @njit(cache=True)
+    def _qft_numba(state, n):
+        for target in range(n-1, -1, -1):
+            _apply_h(state, target)
+            for qubit in range(target):
+                _apply_cp(state, qubit, target, _QFT_PHASES[target-qubit])
+        for qubit in range(n//2):
+            _apply_swap(state, qubit, n-qubit-1)
+        return state
+
+
+def qft_kernels(state):
+    """In-place QFT of a complex128 statevector, applying the gates of the QFT circuit.
+
+    Args:
+        state: The statevector in Qiskit's little-endian order. Its length must be a
+            power of two. It is overwritten with the result.
+
+    Returns:
+        The transformed vector ``state``.
+    """
+    n = state.shape[0].bit_length() - 1
+    if njit is not None:
+        return _qft_numba(state, n)
+    return _qft_numpy(state, n)
@@ -168,33 +168,40 @@ for qubit in range(3):
 # 
 # We'll use Qiskit's [`PhaseGate`](https://qiskit.org/documentation/stubs/qiskit.circuit.library.PhaseGate.html) to create the $T$ operation. The phase gate does the transformation $P|1\rangle = e^{i\lambda}|1\rangle$, where $\lambda$ is the angle we provide. Since we want to implement $T$, which performs $T|1\rangle = e^{2\pi i \theta}|1\rangle$, we need to set $\lambda = \tfrac{2 \pi}{8} = \pi/4$.
 # 
+# Counting qubit $j$ controls $T^{2^j}$. Phase gates simply add up their angles, so instead of repeating the controlled-$T$ gate $2^j$ times we apply it once with the angle $2^j\lambda$ (taken modulo $2\pi$).
+#
 # Also remember that Qiskit orders its qubits the opposite way round to the circuit diagram in the overview.
 
 
 
 repetitions = 1
 for counting_qubit in range(3):
-    for i in range(repetitions):
-        qpe.cp(math.pi/4, counting_qubit, 3); # controlled-T
+    # controlled-T applied `repetitions` times, as one controlled phase gate
+    qpe.cp((repetitions * math.pi/4) % (2*math.pi), counting_qubit, 3)
     repetitions *= 2
 
 
-# We apply the inverse quantum Fourier transformation to convert the state of the counting register, then measure the counting register:
+# We apply the inverse quantum Fourier transformation to convert the state of the counting register, then measure the counting register.
+#
+# For large counting registers the smallest rotations of the inverse QFT barely change the result and can be left out (the approximate QFT), which cuts the number of controlled-phase gates from $O(n^2)$ to $O(n \log n)$ with `approximation_degree = math.ceil(math.log2(n))`. With only three counting qubits every rotation matters, though: already an approximation degree of 1 spreads about 15% of the probability onto a wrong outcome, so we keep the exact transform here:
 
 
 
+approximation_degree = 0
+
 qpe.barrier()
 # Apply inverse QFT
-qpe = qpe.compose(QFT(3, inverse=True), [0,1,2])
+qpe = qpe.compose(QFT(3, approximation_degree=approximation_degree, inverse=True), [0,1,2])
 # Measure
 qpe.barrier()
-for n in range(3):
-    qpe.measure(n,n)
+qpe.measure(range(3), range(3))
 
 
 # ### 2.2 Results <a id='results'></a>
 
-aer_sim = AerSimulator()
+# The result is read off as an integer, so single precision amplitudes are accurate enough
+# and halve the memory the simulator works through
+aer_sim = AerSimulator(precision='single')
 shots = 2048
 qpe = transpile(qpe, aer_sim)
 results = aer_sim.run(qpe, shots=shots).result()
@@ -212,6 +219,87 @@ print(answer)
 # 
 # This is exactly the result we expected!
 
+# ### 2.3 Reusing the Circuit <a id='reusing_the_circuit'></a>
+#
+# When QPE is run for many different phases, building and transpiling the circuit again for every one of them quickly costs more than simulating it. Instead we build the circuit once per size with the phase $\lambda$ left as a [`Parameter`](https://docs.quantum.ibm.com/api/qiskit/qiskit.circuit.Parameter), and cache the transpiled result. Each run then only binds a value to $\lambda$:
+
+from functools import lru_cache
+
+from qiskit.circuit import Parameter
+
+lam = Parameter("lam")
+
+
+@lru_cache(maxsize=32)
+def build_qpe(n_counting):
+    """Return the transpiled QPE circuit of a controlled phase gate P(lam) on n_counting counting qubits."""
+    qpe = QuantumCircuit(n_counting+1, n_counting)
+    qpe.x(n_counting)
+    qpe.h(range(n_counting))
+    # The inverse QFT starts by reversing the counting qubits. Instead of applying these swaps,
+    # counting qubit j gets the power 2**(n_counting-1-j) that would have been swapped onto it.
+    repetitions = 1
+    for counting_qubit in reversed(range(n_counting)):
+        qpe.cp(repetitions * lam, counting_qubit, n_counting)
+        repetitions *= 2
+    qpe.compose(QFT(n_counting, inverse=True, do_swaps=False), range(n_counting), inplace=True)
+    qpe.measure(range(n_counting), range(n_counting))
+    return transpile(qpe, aer_sim)
+
+
+# Binding $\lambda = \pi/4$ gives back the $T$-gate circuit from above:
+
+bound_qpe = build_qpe(3).assign_parameters({lam: math.pi/4})
+assert aer_sim.run(bound_qpe, shots=shots).result().get_counts() == answer
+
+# Scanning over phases now never transpiles again. The bound circuits are submitted to the simulator as one batch, so the per-run setup is only paid once and Aer can run the experiments in parallel. Every phase $\theta = k/8$ is represented exactly by three counting qubits, so each run measures $k$ with certainty:
+
+qpe_t = build_qpe(3)  # transpiled once
+bound_circuits = [qpe_t.assign_parameters({lam: 2*math.pi*k/8}) for k in range(8)]
+results = aer_sim.run(bound_circuits, shots=shots, max_parallel_experiments=0).result()
+for k in range(8):
+    assert results.get_counts(k) == {f"{k:03b}": shots}
+
+
+# ### 2.4 Contracting QPE as a Tensor Network <a id='tensor_network'></a>
+#
+# A statevector simulation keeps track of all $2^{n+1}$ amplitudes of the counting register and the eigenstate. In QPE the eigenstate qubit is only ever touched by diagonal controlled-phase gates, so if we treat the circuit as a tensor network and only ask for the distribution of the counting register, a good contraction order reduces the eigenstate leg to a phase and never builds the full state. If [quimb](https://quimb.readthedocs.io/) is installed, we can compute this distribution by contracting the network, with [cotengra](https://cotengra.readthedocs.io/) finding the contraction order (pass e.g. `optimize=cotengra.HyperOptimizer(max_time=10)` to search harder on large circuits):
+
+try:
+    import quimb.tensor as qtn
+except ImportError:
+    qtn = None
+
+# quimb names of the gates the circuit is translated to
+_QUIMB_GATES = {"h": "H", "x": "X", "cp": "CU1", "swap": "SWAP"}
+
+
+def qpe_tn(qpe_circuit, optimize="auto-hq"):
+    """Return the outcome probabilities of the measured counting register of qpe_circuit by tensor network contraction.
+
+    The probabilities are indexed like Qiskit's counts, i.e. bit i of the index is classical bit i.
+    """
+    # the measurements only tell us which qubit ends up in which classical bit
+    measured = {}
+    for instruction in qpe_circuit.data:
+        if instruction.operation.name == "measure":
+            measured[qpe_circuit.find_bit(instruction.clbits[0]).index] = qpe_circuit.find_bit(instruction.qubits[0]).index
+    unitary = transpile(qpe_circuit.remove_final_measurements(inplace=False),
+                        basis_gates=list(_QUIMB_GATES), optimization_level=0)
+    circ = qtn.Circuit(unitary.num_qubits)
+    for instruction in unitary.data:
+        qubits = [unitary.find_bit(qubit).index for qubit in instruction.qubits]
+        circ.apply_gate(_QUIMB_GATES[instruction.operation.name], *instruction.operation.params, *qubits)
+    where = [measured[clbit] for clbit in range(len(measured))]
+    marginal = circ.compute_marginal(where, optimize=optimize, dtype="complex128")
+    # quimb puts classical bit 0 on the first axis, Qiskit uses it as the least significant bit
+    return np.transpose(marginal).reshape(-1)
+
+
+if qtn is not None:
+    probabilities = qpe_tn(bound_qpe)
+    assert answer == {f"{int(np.argmax(probabilities)):03b}": shots}
+
 
 # ## References <a id='references'></a>
 # 
@@ -162,6 +162,14 @@
 #
 # We now implement Simon's algorithm for an example with $3$-qubits and $b=110$.
 
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# only initialize one GPU, unless the user picked the devices already
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "0")
+
 # importing Qiskit
 from qiskit_aer import AerSimulator
 from qiskit import QuantumCircuit, transpile
@@ -169,29 +177,26 @@ from qiskit import QuantumCircuit, transpile
 # import basic plot tools
 from qiskit.visualization import plot_histogram
 
-def simon_oracle(b):
-    """Returns a Simon oracle for bitstring b.
+def add_simon_oracle(qc, b):
+    """Appends the gates of a Simon oracle for bitstring b to qc, acting on its first 2*len(b) qubits.
 
-    Note: this function is used as found in the archived
+    Note: the oracle is adapted from the archived
     ``qiskit-community/qiskit-textbook``:
     ``https://github.com/qiskit-community/qiskit-textbook/blob/master/qiskit-textbook-src/qiskit_textbook/tools/__init__.py``.
     """
     b = b[::-1] # reverse b for easy iteration
     n = len(b)
-    qc = QuantumCircuit(n*2)
     # Do copy; |x>|0> -> |x>|x>
-    for q in range(n):
-        qc.cx(q, q+n)
-    if '1' not in b:
-        return qc  # 1:1 mapping, so just exit
-    i = b.find('1') # index of first non-zero bit in b
-    # Do |x> -> |s.x> on condition that q_i is 1
-    for q in range(n):
-        if b[q] == '1':
-            qc.cx(i, (q)+n)
+    qc.cx(range(n), range(n, 2*n))
+    if '1' in b: # otherwise it is a 1:1 mapping and we are done
+        i = b.find('1') # index of first non-zero bit in b
+        # Do |x> -> |s.x> on condition that q_i is 1
+        targets = [q+n for q in range(n) if b[q] == '1']
+        qc.cx([i]*len(targets), targets)
     return qc
 
-# The function `simon_oracle` creates a Simon oracle for the bitstring `b`. This is given without explanation, but we will discuss the method in [section 4](#oracle).
+
+# The function `add_simon_oracle` adds the gates of a Simon oracle for the bitstring `b` to a circuit. This is given without explanation, but we will discuss the method in [section 4](#oracle).
 #
 # In Qiskit, measurements are only allowed at the end of the quantum circuit. In the case of Simon's algorithm, we actually do not care about the output of the second register, and will only measure the first register.
 
@@ -206,7 +211,8 @@ simon_circuit.h(range(n))
 # Apply barrier for visual separation
 simon_circuit.barrier()
 
-simon_circuit = simon_circuit.compose(simon_oracle(b))
+# Add the oracle's gates directly, rather than building it as a separate circuit
+add_simon_oracle(simon_circuit, b)
 
 # Apply barrier for visual separation
 simon_circuit.barrier()
@@ -221,27 +227,63 @@ simon_circuit.measure(range(n), range(n))
 #
 # We can run the above circuit on the simulator.
 
+@lru_cache(maxsize=None)
+def get_backend():
+    """Return the local simulator, created and configured once."""
+    # The circuit only contains H and CX gates, so on the CPU the stabilizer method simulates it
+    # in polynomial time. (A matrix product state would not help here: the oracle's copy step
+    # entangles every qubit x_i with its partner f_i, n qubits away.)
+    simulator = AerSimulator(method='stabilizer')
+    # on the GPU if this Aer build has one, reconfiguring the same instance
+    if "GPU" in simulator.available_devices():
+        simulator.set_options(method='statevector', device='GPU', precision='single',
+                              batched_shots_gpu=True, batched_shots_gpu_max_qubits=16)
+    return simulator
+
+
 # use local simulator
-simulator = AerSimulator()
-sim_job = simulator.run(simon_circuit, shots=1000)
+simulator = get_backend()
+sim_job = simulator.run(transpile(simon_circuit, simulator, optimization_level=3), shots=1000)
 result = sim_job.result()
+assert result.results[0].metadata['measure_sampling']
 counts = result.get_counts()
 print(counts)
 
+# For a circuit this small, the same samples can also be drawn without a simulator backend:
+# compute the statevector before the measurements once with `Statevector`, then draw all the
+# shots for the first register from its probabilities at once.
+
+from qiskit.quantum_info import Statevector
+
+simon_state = Statevector(simon_circuit.remove_final_measurements(inplace=False))
+sampled_counts = {str(z): int(c) for z, c in simon_state.sample_counts(1000, qargs=range(n)).items()}
+assert set(sampled_counts) <= set(simon_state.probabilities_dict(qargs=range(n)))
+print(sampled_counts)
+
 
 
 # Since we know $b$ already, we can verify these results do satisfy $b\cdot z  = 0 \pmod{2}$:
 
 # Calculate the dot product of the results
 def bdotz(b, z):
-    accum = 0
-    for i in range(len(b)):
-        accum += int(b[i]) * int(z[i])
-    return (accum % 2)
+    # the bits set in both strings, counted with one popcount
+    return (int(b, 2) & int(z, 2)).bit_count() & 1
 
 for z in counts:
     print( '{}.{} = {} (mod 2)'.format(b, z, bdotz(b,z)) )
 
+# For many results the same check runs on all of them at once with NumPy:
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    # NumPy < 2 has no popcount ufunc, so the bits of each byte are unpacked and counted
+    def _popcount(a):
+        a = np.asarray(a, dtype=np.uint64)
+        return np.unpackbits(a.reshape(*a.shape, 1).view(np.uint8), axis=-1).sum(axis=-1)
+
+zs = np.array([int(z, 2) for z in counts], dtype=np.uint64)
+assert not (_popcount(zs & np.uint64(int(b, 2))) & 1).any()
+
 
 # Using these results, we can recover the value of $b = 110$ by solving this set of simultaneous equations. For example, say we first measured `001`, this tells us:
 #
@@ -276,6 +318,13 @@ for z in counts:
 #
 # Of which $b  = 110$ is the non-trivial solution to our simultaneous equations. We can solve these problems in general using [Gaussian elimination](https://mathworld.wolfram.com/GaussianElimination.html), which has a run time of $O(n^3)$.
 
+# `gf2.py` implements this elimination over GF(2). Each measured $z$ is stored as the bits of one integer, so that adding two equations is a single XOR, and it is compiled with Numba when it is installed. With the results from our simulation, the only non-trivial solution is $b$:
+
+from gf2 import gf2_nullspace
+
+solutions = gf2_nullspace([int(z, 2) for z in counts], n)
+assert [f"{s:0{n}b}" for s in solutions] == [b]
+
 # ## 4. Oracle <a id='oracle'></a>
 #
 # The above [example](#example) and [implementation](#implementation) of Simon's algorithm are specifically for specific values of $b$. To extend the problem to other secret bit strings, we need to discuss the Simon query function or oracle in more detail.
@@ -0,0 +1,85 @@
+"""Gaussian elimination over GF(2), used to recover Simon's hidden bitstring from the measured results.
+
+Each equation b.z = 0 (mod 2) is stored as one uint64 row whose bits are the bits of z, so
+adding two equations is a single XOR. The elimination is compiled with Numba when it is
+installed, and falls back to vectorized NumPy row operations otherwise.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+def _rref_numpy(rows, n):
+    rank = 0
+    pivots = np.empty(n, dtype=np.int64)
+    for col in range(n-1, -1, -1):
+        bit = np.uint64(1) << np.uint64(col)
+        candidates = np.flatnonzero(rows[rank:] & bit)
+        if len(candidates) == 0:
+            continue
+        pivot = rank + candidates[0]
+        rows[[rank, pivot]] = rows[[pivot, rank]]
+        # clear the column in every other row with one XOR each
+        others = (rows & bit).astype(bool)
+        others[rank] = False
+        rows[others] ^= rows[rank]
+        pivots[rank] = col
+        rank += 1
+    return rank, pivots
+
+
+if njit is not None:
+
+    @njit(parallel=True, cache=True)
+    def _rref_numba(rows, n):
+        rank = 0
+        pivots = np.empty(n, dtype=np.int64)
+        for col in range(n-1, -1, -1):
+            bit = np.uint64(1) << np.uint64(col)
+            pivot = -1
+            for r in range(rank, rows.shape[0]):
+                if rows[r] & bit:
+                    pivot = r
+                    break
+            if pivot < 0:
+                continue
+            rows[rank], rows[pivot] = rows[pivot], rows[rank]
+            # the rows are independent of each other, so they are cleared in parallel
+            for r in prange(rows.shape[0]):
+                if r != rank and rows[r] & bit:
+                    rows[r] ^= rows[rank]
+            pivots[rank] = col
+            rank += 1
+        return rank, pivots
+
+
+def gf2_nullspace(zs, n):
+    """Basis of all n-bit strings b with b.z = 0 (mod 2) for every z in ``zs``.
+
+    Args:
+        zs: The measured bitstrings as integers (bit i of an integer is bit i of z). At most
+            64 bits are supported.
+        n: The number of bits.
+
+    Returns:
+        A list of integers spanning the solutions, excluding the trivial all-zero string.
+    """
+    rows = np.array(zs, dtype=np.uint64)
+    if njit is not None:
+        rank, pivots = _rref_numba(rows, n)
+    else:
+        rank, pivots = _rref_numpy(rows, n)
+    pivot_cols = [int(col) for col in pivots[:rank]]
+    basis = []
+    # every free column gives one solution, in which each pivot bit cancels that column's row
+    for free in sorted(set(range(n)) - set(pivot_cols)):
+        b = 1 << free
+        for row, col in enumerate(pivot_cols):
+            if (int(rows[row]) >> free) & 1:
+                b |= 1 << col
+        basis.append(b)
+    return basis
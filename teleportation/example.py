@@ -58,11 +58,8 @@ def create_bell_pair(qc, a, b):
 
 
 
-## SETUP
-# Protocol uses 3 qubits and 2 classical bits in 2 different registers
-qr = QuantumRegister(3, name="q")
-crz, crx = ClassicalRegister(1, name="crz"), ClassicalRegister(1, name="crx")
-teleportation_circuit = QuantumCircuit(qr, crz, crx)
+# The circuit is built up step by step: each step below adds its gates to the
+# same teleportation_circuit, instead of rebuilding it from scratch.
 
 ## STEP 1
 # In our case, Telamon entangles qubits q1 and q2
@@ -85,15 +82,6 @@ def alice_gates(qc, psi, a):
 
 
 
-## SETUP
-# Protocol uses 3 qubits and 2 classical bits in 2 different registers
-qr = QuantumRegister(3, name="q")
-crz, crx = ClassicalRegister(1, name="crz"), ClassicalRegister(1, name="crx")
-teleportation_circuit = QuantumCircuit(qr, crz, crx)
-
-## STEP 1
-create_bell_pair(teleportation_circuit, 1, 2)
-
 ## STEP 2
 teleportation_circuit.barrier() # Use barrier to separate steps
 alice_gates(teleportation_circuit, 0, 1)
@@ -114,19 +102,6 @@ def measure_and_send(qc, a, b):
 
 
 
-## SETUP
-# Protocol uses 3 qubits and 2 classical bits in 2 different registers
-qr = QuantumRegister(3, name="q")
-crz, crx = ClassicalRegister(1, name="crz"), ClassicalRegister(1, name="crx")
-teleportation_circuit = QuantumCircuit(qr, crz, crx)
-
-## STEP 1
-create_bell_pair(teleportation_circuit, 1, 2)
-
-## STEP 2
-teleportation_circuit.barrier() # Use barrier to separate steps
-alice_gates(teleportation_circuit, 0, 1)
-
 ## STEP 3
 measure_and_send(teleportation_circuit, 0 ,1)
 
@@ -149,37 +124,39 @@ measure_and_send(teleportation_circuit, 0 ,1)
 
 # This function takes a QuantumCircuit (qc), integer (qubit)
 # and ClassicalRegisters (crz & crx) to decide which gates to apply
-def bob_gates(qc, qubit, crz, crx):
-    # Here we use if_test to control our gates with a classical bit instead of
-    # a qubit
-    # Apply gates if the registers are in the state '1'
-    with qc.if_test((crx, 1)):
-        qc.x(qubit)
-
-    with qc.if_test((crz, 1)):
-        qc.z(qubit)
-
-
-
-## SETUP
-# Protocol uses 3 qubits and 2 classical bits in 2 different registers
-qr = QuantumRegister(3, name="q")
-crz, crx = ClassicalRegister(1, name="crz"), ClassicalRegister(1, name="crx")
-teleportation_circuit = QuantumCircuit(qr, crz, crx)
-
-## STEP 1
-create_bell_pair(teleportation_circuit, 1, 2)
+def bob_gates(qc, qubit, crz, crx, use_if_test=True):
+    if use_if_test:
+        # Here we use if_test to control our gates with a classical bit instead of
+        # a qubit
+        # Apply gates if the registers are in the state '1'
+        with qc.if_test((crx, 1)):
+            qc.x(qubit)
+
+        with qc.if_test((crz, 1)):
+            qc.z(qubit)
+    else:
+        # Without classical control flow: after the measurement, Alice's qubits stay
+        # in the measured states, so gates controlled by those qubits act exactly like
+        # gates conditioned on the bits. This keeps the whole circuit a plain sequence
+        # of gates for the simulator.
+        qc.cx(_measured_qubit(qc, crx[0]), qubit)
+        qc.cz(_measured_qubit(qc, crz[0]), qubit)
+
+
+def _measured_qubit(qc, clbit):
+    """Returns the qubit whose measurement was last stored in clbit"""
+    for instruction in reversed(qc.data):
+        if instruction.operation.name == "measure" and instruction.clbits[0] == clbit:
+            return instruction.qubits[0]
+    raise ValueError(f"{clbit} is not measured in the circuit")
 
-## STEP 2
-teleportation_circuit.barrier() # Use barrier to separate steps
-alice_gates(teleportation_circuit, 0, 1)
 
-## STEP 3
-measure_and_send(teleportation_circuit, 0, 1)
 
 ## STEP 4
 teleportation_circuit.barrier() # Use barrier to separate steps
-bob_gates(teleportation_circuit, 2, crz, crx)
+# The simulator does not need classical control flow; pass use_if_test=True
+# to run on hardware that supports dynamic circuits
+bob_gates(teleportation_circuit, 2, crz, crx, use_if_test=False)
 
 sim = AerSimulator()
 teleportation_circuit.save_statevector()
@@ -187,6 +164,23 @@ out_vector = sim.run(teleportation_circuit).result().get_statevector()
 print(out_vector)
 
 
+# Steps 1 to 3 are the same every time the protocol runs, so they can also be built once as a template, which is then added to a new circuit with a single `compose`:
+
+TELEPORT_TEMPLATE = QuantumCircuit(3, 2)
+create_bell_pair(TELEPORT_TEMPLATE, 1, 2)
+TELEPORT_TEMPLATE.barrier()
+alice_gates(TELEPORT_TEMPLATE, 0, 1)
+measure_and_send(TELEPORT_TEMPLATE, 0, 1)
+
+composed_circuit = QuantumCircuit(qr, crz, crx)
+composed_circuit.compose(TELEPORT_TEMPLATE, qubits=[0, 1, 2], clbits=[0, 1], inplace=True)
+composed_circuit.barrier()
+bob_gates(composed_circuit, 2, crz, crx, use_if_test=False)
+
+# it is the same circuit as the one we built step by step
+assert composed_circuit.data == teleportation_circuit.data[:-1]
+
+
 # ## References <a id='references'></a>
 # [1] M. Nielsen and I. Chuang, Quantum Computation and Quantum Information, Cambridge Series on Information and the Natural Sciences (Cambridge University Press, Cambridge, 2000).
 # 
@@ -1,10 +1,18 @@
 from qiskit_aer import AerSimulator
 import logging
 from typing import Optional
+import sys
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from scipy.optimize import minimize
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
 # Pre-defined ansatz circuit and operator class for Hamiltonian
 from qiskit.circuit.library import EfficientSU2
 from qiskit.quantum_info import SparsePauliOp
@@ -13,8 +21,35 @@ from qiskit_ibm_runtime import (
     EstimatorV2 as Estimator,
     SamplerV2 as Sampler,
 )
+from qiskit.circuit.library import CXGate
+from qiskit.transpiler import PassManager
+from qiskit.transpiler.passes import (
+    CommutativeCancellation,
+    InverseCancellation,
+    Optimize1qGatesDecomposition,
+)
 from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
 
+from spsa import spsa_minimize
+from vqe_kernels import ansatz_energies, compile_ansatz
+
+# the callback prints its progress line every this many iterations
+PROGRESS_EVERY = 10
+
+# Estimate the energies with the Estimator primitive, with shot noise as on
+# hardware, even on a simulator whose exact energies the statevector kernels
+# could compute. This runs the grouped, truncated Hamiltonian and SPSA. The
+# --estimator command-line flag sets it for a single run
+USE_ESTIMATOR = False
+
+# precision of the Estimator's energy estimates, which also sets how small a
+# Hamiltonian term may be before it is dropped
+ESTIMATOR_PRECISION = 1 / 64
+
+# scipy.optimize.minimize methods that take the gradient together with the cost
+_GRADIENT_METHODS = {"CG", "BFGS", "L-BFGS-B", "TNC", "SLSQP"}
+
+
 def build_callback(ansatz, hamiltonian, estimator, callback_dict):
     """Return callback function that uses Estimator instance,
     and stores intermediate values into a dictionary.
@@ -22,13 +57,21 @@ def build_callback(ansatz, hamiltonian, estimator, callback_dict):
     Parameters:
         ansatz (QuantumCircuit): Parameterized ansatz circuit
         hamiltonian (SparsePauliOp): Operator representation of Hamiltonian
-        estimator (Estimator): Estimator primitive instance
+        estimator (Estimator): Estimator primitive instance, or None
+                               (see evaluate_energies)
         callback_dict (dict): Mutable dict for storing values
 
     Returns:
         Callable: Callback function object
     """
 
+    # only a terminal shows the progress line, so check once whether stdout is one
+    show_progress = sys.stdout.isatty()
+    # the cache and the history are never replaced, only updated, so the
+    # callback can keep them in local names instead of looking them up each time
+    energies = callback_dict["_energies"]
+    cost_history = callback_dict["cost_history"]
+
     def callback(current_vector):
         """Callback function storing previous solution vector,
         computing the intermediate cost value, and displaying number
@@ -44,114 +87,397 @@ def build_callback(ansatz, hamiltonian, estimator, callback_dict):
         callback_dict["iters"] += 1
         # Set the prev_vector to the latest one
         callback_dict["prev_vector"] = current_vector
-        # Compute the value of the cost function at the current vector
-        callback_dict["cost_history"].append(
-            estimator.run([(ansatz, hamiltonian, current_vector)])
-            .result()[0]
-        )
-        # Grab the current time
-        current_time = time.perf_counter()
+        # Reuse the cost that cost_func already computed at the current vector,
+        # and only send the vector to the estimator again if it was never evaluated
+        key = _cache_key(current_vector)
+        if key not in energies:
+            energies[key] = evaluate_energies(current_vector, ansatz, hamiltonian, estimator)
+        # a plain float, rather than the 0-d array the estimator returns
+        cost_history.append(float(energies[key]))
+        # Grab the current time (integer nanoseconds)
+        current_time = time.perf_counter_ns()
         # Find the total time of the execute (after the 1st iteration)
         if callback_dict["iters"] > 1:
-            callback_dict["_total_time"] += current_time - callback_dict["_prev_time"]
+            callback_dict["_total_time"] += (current_time - callback_dict["_prev_time"]) * 1e-9
         # Set the previous time to the current time
         callback_dict["_prev_time"] = current_time
-        # Compute the average time per iteration and round it
-        time_str = (
-            round(callback_dict["_total_time"] / (callback_dict["iters"] - 1), 2)
-            if callback_dict["_total_time"]
-            else "-"
-        )
-        # Print to screen on single line
-        print(
-            "Iters. done: {} [Avg. time per iter: {}]".format(
-                callback_dict["iters"], time_str
-            ),
-            end="\r",
-            flush=True,
-        )
+        # Formatting and flushing the progress line can take longer than a fast
+        # iteration, so only every PROGRESS_EVERY-th iteration is printed, and
+        # only to a terminal
+        if show_progress and callback_dict["iters"] % PROGRESS_EVERY == 0:
+            # Compute the average time per iteration and round it
+            avg_time = round(callback_dict["_total_time"] / (callback_dict["iters"] - 1), 2)
+            # Print to screen on single line
+            print(
+                f"Iters. done: {callback_dict['iters']} [Avg. time per iter: {avg_time}]",
+                end="\r",
+                flush=True,
+            )
 
     return callback
 
 
-def cost_func(params, ansatz, hamiltonian, estimator):
+# gate tables of the ansatz circuits seen so far, keyed by id; the circuit is
+# kept alongside so that its id cannot be reused by another circuit
+_COMPILED_ANSATZ = {}
+
+
+def _compiled_ansatz(ansatz):
+    """Return the gate table of ansatz, flattening the circuit only once"""
+    entry = _COMPILED_ANSATZ.get(id(ansatz))
+    if entry is None or entry[0] is not ansatz:
+        entry = (ansatz, compile_ansatz(ansatz))
+        _COMPILED_ANSATZ[id(ansatz)] = entry
+    return entry[1]
+
+
+def statevector_energies(params, ansatz, hamiltonian_matrix):
+    """Return exact energies for one or many parameter vectors
+
+    The ansatz gates are applied directly to a statevector by the kernels
+    in vqe_kernels.py, and the energy is the inner product <psi|H|psi>
+    with the dense Hamiltonian matrix.
+
+    Parameters:
+        params (ndarray): Array of ansatz parameters, or a 2D array
+                          with one parameter vector per row
+        ansatz (QuantumCircuit): Parameterized ansatz circuit, made of
+                                 RY, RZ and CX gates
+        hamiltonian_matrix (ndarray): Dense matrix of the Hamiltonian
+
+    Returns:
+        ndarray: Energies, one per parameter vector
+    """
+    gates, angles, initial_state = _compiled_ansatz(ansatz)
+    return ansatz_energies(params, gates, angles, initial_state, hamiltonian_matrix)
+
+
+def evaluate_energies(params, ansatz, hamiltonian, estimator):
+    """Return energy estimates for one or many parameter vectors
+
+    All vectors are sent to the estimator as a single pub, which
+    broadcasts the Hamiltonian over them.
+
+    Parameters:
+        params (ndarray): Array of ansatz parameters, or a 2D array
+                          with one parameter vector per row
+        ansatz (QuantumCircuit): Parameterized ansatz circuit
+        hamiltonian (SparsePauliOp): Operator representation of Hamiltonian,
+                                     a list of its commuting groups, or its
+                                     dense matrix if estimator is None
+        estimator (Estimator): Estimator primitive instance, or None to
+                               compute the exact energies from the statevector
+
+    Returns:
+        ndarray: Energy estimates, one per parameter vector
+    """
+    if estimator is None:
+        return statevector_energies(params, ansatz, hamiltonian)
+    if isinstance(hamiltonian, list):
+        # one observable per group along a leading axis, broadcast over
+        # the parameter vectors, and the group energies summed afterwards
+        observables = hamiltonian
+        for _ in range(np.ndim(params) - 1):
+            observables = [[group] for group in observables]
+        return _estimator_evs(estimator, (ansatz, observables, params)).sum(axis=0)
+    return _estimator_evs(estimator, (ansatz, hamiltonian, params))
+
+
+def _estimator_evs(estimator, pub):
+    """Run a single pub on the estimator and return its expectation values"""
+    pub_result = estimator.run([pub]).result()[0]
+    return pub_result.data.evs
+
+
+def _cache_key(params):
+    """Return the key of a parameter vector in the energy caches"""
+    return np.asarray(params, dtype=np.float64).tobytes()
+
+
+def cost_func(params, ansatz, hamiltonian, estimator, callback_dict=None):
     """Return estimate of energy from estimator
 
     Parameters:
         params (ndarray): Array of ansatz parameters
         ansatz (QuantumCircuit): Parameterized ansatz circuit
         hamiltonian (SparsePauliOp): Operator representation of Hamiltonian
-        estimator (Estimator): Estimator primitive instance
+        estimator (Estimator): Estimator primitive instance, or None
+                               (see evaluate_energies)
+        callback_dict (dict): Optional dict in which the energies are cached
+                              by parameter vector, so that repeated vectors
+                              and the callback do not evaluate them again
 
     Returns:
         float: Energy estimate
     """
-    energy = (
-        estimator.run([(ansatz, hamiltonian, params)]).result()[0].data.evs
-    )
-    return energy
+    if callback_dict is None:
+        return evaluate_energies(params, ansatz, hamiltonian, estimator)
+    key = _cache_key(params)
+    energies = callback_dict["_energies"]
+    if key in energies:
+        callback_dict["cache_hits"] += 1
+    else:
+        energies[key] = evaluate_energies(params, ansatz, hamiltonian, estimator)
+    return energies[key]
+
+
+def cost_and_grad(params, ansatz, hamiltonian, estimator, callback_dict=None):
+    """Return estimate of energy and its gradient from a single estimator pub
+
+    The gradient is given analytically by the parameter-shift rule: every
+    parameter of the ansatz drives a single Pauli rotation, so each partial
+    derivative is half the difference of the energies with that parameter
+    shifted by +pi/2 and -pi/2. The energy and all 2*len(params) shifted
+    points are estimated together in one batch.
+
+    Parameters:
+        params (ndarray): Array of ansatz parameters
+        ansatz (QuantumCircuit): Parameterized ansatz circuit
+        hamiltonian (SparsePauliOp): Operator representation of Hamiltonian
+        estimator (Estimator): Estimator primitive instance, or None
+                               (see evaluate_energies)
+        callback_dict (dict): Optional dict in which the energies and
+                              gradients are cached by parameter vector, so
+                              that repeated vectors and the callback do not
+                              evaluate them again
+
+    Returns:
+        tuple: Energy estimate and gradient (ndarray)
+    """
+    if callback_dict is not None:
+        key = _cache_key(params)
+        if key in callback_dict["_gradients"]:
+            callback_dict["cache_hits"] += 1
+            return callback_dict["_energies"][key], callback_dict["_gradients"][key]
+    shifts = (np.pi / 2) * np.eye(len(params))
+    params_batch = np.vstack([params, params + shifts, params - shifts])
+    energies = evaluate_energies(params_batch, ansatz, hamiltonian, estimator)
+    energy = energies[0]
+    grad = 0.5 * (energies[1 : len(params) + 1] - energies[len(params) + 1 :])
+    if callback_dict is not None:
+        callback_dict["_energies"][key] = energy
+        callback_dict["_gradients"][key] = grad
+    return energy, grad
 
 
 def run_vqe(initial_parameters, ansatz, operator, estimator, method):
+    """Minimize the energy with method, which is either a scipy.optimize.minimize
+    method or "SPSA" for the batched SPSA loop in spsa.py"""
     callback_dict = {
         "prev_vector": None,
         "iters": 0,
         "cost_history": [],
         "_total_time": 0,
         "_prev_time": None,
+        "cache_hits": 0,
+        "_energies": {},
+        "_gradients": {},
     }
     callback = build_callback(ansatz, operator, estimator, callback_dict)
+    if method == "SPSA":
+        energy_cache = callback_dict["_energies"]
+
+        def batch_cost(params_batch):
+            energies = evaluate_energies(params_batch, ansatz, operator, estimator)
+            # the first row is the current point, which the callback reports
+            energy_cache[_cache_key(params_batch[0])] = energies[0]
+            return energies
+
+        result = spsa_minimize(batch_cost, initial_parameters, callback=callback)
+        return result, callback_dict
+    # gradient-based optimizers get the energy and the gradient from one batched pub
+    jac = method in _GRADIENT_METHODS
     result = minimize(
-        cost_func,
+        cost_and_grad if jac else cost_func,
         initial_parameters,
-        args=(ansatz, operator, estimator),
+        args=(ansatz, operator, estimator, callback_dict),
         method=method,
+        jac=jac,
         callback=callback,
     )
     return result, callback_dict
 
 
+def _run_vqe_single_threaded(initial_parameters, ansatz, operator, estimator, method):
+    """run_vqe for a worker process, limited to one thread so that the
+    parallel restarts do not oversubscribe the cores"""
+    if numba is not None:
+        numba.set_num_threads(1)
+    return run_vqe(initial_parameters, ansatz, operator, estimator, method)
+
+
+def run_vqe_restarts(initial_parameters, ansatz, operator, estimator, method, max_workers=1):
+    """Run VQE from several initial points, optionally in parallel processes
+
+    The energy landscape is non-convex, so independent restarts can find a
+    lower minimum, and the lowest energy found wins. With max_workers=1 they
+    run one after the other in this process.
+
+    Parameters:
+        initial_parameters (ndarray): 2D array with one initial point per row
+        ansatz (QuantumCircuit): Parameterized ansatz circuit
+        operator (SparsePauliOp): Hamiltonian, as for run_vqe
+        estimator (Estimator): Estimator, as for run_vqe
+        method (str): Optimization method, as for run_vqe
+        max_workers (int): Number of worker processes, or None for one per core
+
+    Returns:
+        tuple: The result and callback dict of the restart with the lowest energy
+    """
+    if max_workers == 1 or len(initial_parameters) == 1:
+        runs = [run_vqe(x0, ansatz, operator, estimator, method) for x0 in initial_parameters]
+    else:
+        # the workers are spawned, not forked, as described in the README: a
+        # process forked after Aer has run can deadlock in its OpenMP runtime
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(_run_vqe_single_threaded, x0, ansatz, operator, estimator, method)
+                for x0 in initial_parameters
+            ]
+            runs = [future.result() for future in futures]
+    return min(runs, key=lambda run: run[0].fun)
+
+
+def drop_small_terms(hamiltonian, atol):
+    """Return Hamiltonian without its terms with coefficients below atol
+
+    Dropping terms biases every energy estimate by at most the sum of the
+    absolute values of the dropped coefficients.
+
+    Parameters:
+        hamiltonian (SparsePauliOp): Operator representation of Hamiltonian
+        atol (float): Coefficient magnitude below which a term is dropped
+
+    Returns:
+        tuple: Truncated Hamiltonian (SparsePauliOp) and the bound on the
+               energy error it introduces (float)
+    """
+    hamiltonian = hamiltonian.simplify()
+    small = np.abs(hamiltonian.coeffs) < atol
+    return hamiltonian[np.flatnonzero(~small)], float(np.abs(hamiltonian.coeffs[small]).sum())
+
+
+def sample_counts(sampler, circuit, batch_shots=500, max_shots=10000, tolerance=0.02):
+    """Sample circuit in batches until the most frequent outcome is pinned down
+
+    Sampling stops once the 95% Wilson confidence interval of the probability
+    of the most frequent outcome is narrower than +/- tolerance, or when
+    max_shots are reached. A peaked distribution needs far fewer shots than
+    a flat one.
+
+    Parameters:
+        sampler (Sampler): Sampler primitive instance
+        circuit (QuantumCircuit): Circuit with its measurements in register 'meas'
+        batch_shots (int): Number of shots per sampler job
+        max_shots (int): Upper bound on the total number of shots
+        tolerance (float): Half-width of the confidence interval to reach
+
+    Returns:
+        dict: Accumulated counts
+    """
+    z = 1.96
+    counts = {}
+    shots = 0
+    while shots < max_shots:
+        batch = min(batch_shots, max_shots - shots)
+        batch_counts = sampler.run([circuit], shots=batch).result()[0].data.meas.get_counts()
+        for outcome, count in batch_counts.items():
+            counts[outcome] = counts.get(outcome, 0) + count
+        shots += batch
+        p = max(counts.values()) / shots
+        half_width = z / (1 + z**2 / shots) * np.sqrt(p * (1 - p) / shots + z**2 / (4 * shots**2))
+        if half_width < tolerance:
+            break
+    return counts
+
+
 if __name__ == "__main__":
 
     # Define the Hamiltonian, here an example sparse Pauli operator
     hamiltonian = SparsePauliOp.from_list(
         [("YZ", 0.3980), ("ZI", -0.3980), ("ZZ", -0.0113), ("XX", 0.1810)]
-    )
+    ).simplify()
 
     # Define the Ansatz, here we take EfficientSU2 as an example ansatz
-    ansatz = EfficientSU2(hamiltonian.num_qubits)
-    ansatz.decompose()
+    # decomposed up front, so the pass manager has no high-level block to synthesize
+    ansatz = EfficientSU2(hamiltonian.num_qubits).decompose()
 
-    method = "COBYLA"
+    # with the parameter-shift gradient, a quasi-Newton method needs far fewer
+    # steps than a derivative-free one such as COBYLA
+    method = "L-BFGS-B"
     backend = AerSimulator()
+    use_estimator = USE_ESTIMATOR or "--estimator" in sys.argv[1:]
 
-    initial_parameters = 2 * np.pi * np.random.rand(ansatz.num_parameters)
-    pm = generate_preset_pass_manager(backend=backend, optimization_level=1)
+    # one initial point per restart; more restarts can be spread over worker
+    # processes with the max_workers argument of run_vqe_restarts
+    restarts = 1
+    initial_parameters = 2 * np.pi * np.random.rand(restarts, ansatz.num_parameters)
+    # The ansatz is evaluated in every iteration, so it gets the most thorough
+    # optimization; the one-off transpile cost is amortized over the whole run
+    pm = generate_preset_pass_manager(backend=backend, optimization_level=3)
     ansatz_isa = pm.run(ansatz)
     operator_isa = hamiltonian.apply_layout(ansatz_isa.layout)
 
-    estimator = Estimator(backend)
-    vqe_result, callback_dict = run_vqe(
+    use_kernels = isinstance(backend, AerSimulator) and not use_estimator
+    if use_kernels:
+        try:
+            _compiled_ansatz(ansatz_isa)
+        except ValueError:
+            # The kernels do not implement all the gates of this ansatz, so its
+            # energies are estimated by the Estimator instead
+            use_kernels = False
+    if use_kernels:
+        # On a simulator the energies can be computed exactly from the statevector,
+        # so the Hamiltonian is turned into its dense matrix once, and no estimator
+        # job is run per iteration
+        estimator = None
+        operator = operator_isa.to_matrix()
+        energy_error = 0.0
+    else:
+        estimator = Estimator(backend, options={"default_precision": ESTIMATOR_PRECISION})
+        # Every term costs measurements in every iteration, so terms smaller than
+        # the estimator's precision are dropped, at the price of a bounded bias
+        # in the energy
+        operator, energy_error = drop_small_terms(operator_isa, atol=ESTIMATOR_PRECISION)
+        # Group the qubit-wise commuting terms once, so that each group is
+        # measured with a single circuit in every iteration
+        operator = operator.group_commuting(qubit_wise=True)
+        # With shot noise on every estimate, SPSA's two-point gradient is far
+        # cheaper per iteration than 2*n parameter-shift points, and as robust
+        method = "SPSA"
+    vqe_result, callback_dict = run_vqe_restarts(
         initial_parameters=initial_parameters,
         ansatz=ansatz_isa,
-        operator=operator_isa,
+        operator=operator,
         estimator=estimator,
         method=method,
     )
 
 
-    qc = ansatz.assign_parameters(vqe_result.x)
-    qc.measure_all()
-    qc_isa = pm.run(qc)
+    # bind the already transpiled ansatz, so its layout and routing are reused
+    # instead of running the pass manager again. With the parameters bound, the
+    # single-qubit rotations can be merged, which only needs a few local passes
+    post_bind_pm = PassManager(
+        [
+            Optimize1qGatesDecomposition(target=backend.target),
+            CommutativeCancellation(target=backend.target),
+            InverseCancellation([CXGate()]),
+        ]
+    )
+    qc_isa = post_bind_pm.run(ansatz_isa.assign_parameters(vqe_result.x))
+    qc_isa.measure_all()
 
     sampler = Sampler(backend)
-    samp_dist = sampler.run([qc_isa], shots=int(1e4)).result()[0].data.meas.get_counts()
+    samp_dist = sample_counts(sampler, qc_isa, max_shots=int(1e4))
 
     print(
         {
             "result": samp_dist,
             "optimal_point": vqe_result.x.tolist(),
             "optimal_value": vqe_result.fun,
+            "energy_error_bound": energy_error,
             "optimizer_time": callback_dict.get("_total_time", 0),
+            "cache_hits": callback_dict["cache_hits"],
         }
     )
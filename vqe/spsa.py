@@ -0,0 +1,72 @@
+"""Simultaneous perturbation stochastic approximation (SPSA) for noisy VQE energies.
+
+Every iteration estimates the gradient from just two energies, at the parameters
+shifted by +c_k and -c_k along one random +/-1 direction, whatever the number of
+parameters. Both points are evaluated together with the current parameters, in a
+single batch. The update arithmetic is compiled with Numba when it is installed,
+and falls back to NumPy otherwise.
+"""
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _spsa_step_numpy(params, delta, energy_plus, energy_minus, a_k, c_k):
+    # the same difference quotient serves every component, scaled by 1/delta_i = delta_i
+    return params - a_k * (energy_plus - energy_minus) / (2 * c_k) * delta
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _spsa_step_numba(params, delta, energy_plus, energy_minus, a_k, c_k):
+        step = a_k * (energy_plus - energy_minus) / (2 * c_k)
+        updated = np.empty_like(params)
+        for i in range(params.shape[0]):
+            updated[i] = params[i] - step * delta[i]
+        return updated
+
+
+def spsa_minimize(batch_cost, x0, maxiter=200, a=2.0, c=0.2, stability=10, alpha=0.602,
+                  gamma=0.101, callback=None, seed=None, resamples=64):
+    """Minimize a noisy cost function with SPSA.
+
+    Args:
+        batch_cost: Function that takes a 2D array with one parameter vector per
+            row and returns their costs. It is called once per iteration, with the
+            current parameters in the first row followed by the two shifted points.
+        x0: The initial parameters.
+        maxiter: The number of iterations.
+        a, c: Initial step size and perturbation size. They decay as
+            ``a / (k + 1 + stability)**alpha`` and ``c / (k + 1)**gamma``.
+        stability, alpha, gamma: The gain sequence constants.
+        callback: Optional function called with the current parameters in every
+            iteration, after they are evaluated.
+        seed: Seed of the random perturbation directions.
+        resamples: The number of times the cost of the final parameters is
+            evaluated, in one more batch, to average out its noise.
+
+    Returns:
+        A ``scipy.optimize.OptimizeResult`` with the final parameters, the mean of
+        their resampled costs, and the number of iterations and cost evaluations.
+        The lowest of the noisy costs seen during the run is not reported, as it
+        would be biased below the true cost.
+    """
+    step = _spsa_step_numba if njit is not None else _spsa_step_numpy
+    rng = np.random.default_rng(seed)
+    params = np.array(x0, dtype=np.float64)
+    for k in range(maxiter):
+        a_k = a / (k + 1 + stability) ** alpha
+        c_k = c / (k + 1) ** gamma
+        delta = rng.choice([-1.0, 1.0], size=params.shape[0])
+        costs = batch_cost(np.vstack([params, params + c_k * delta, params - c_k * delta]))
+        if callback is not None:
+            callback(params)
+        params = step(params, delta, costs[1], costs[2], a_k, c_k)
+    cost = np.mean(batch_cost(np.tile(params, (resamples, 1))))
+    return OptimizeResult(x=params, fun=cost, nit=maxiter, nfev=3 * maxiter + resamples)
@@ -0,0 +1,165 @@
+"""Exact VQE energies of a bound ansatz, computed directly on its statevector.
+
+The ansatz is flattened once into a small table of RY, RZ and CX gates, which is
+then applied to the statevector of every parameter vector, followed by the
+inner product <psi|H|psi> with the dense Hamiltonian. Gates at the start of the
+ansatz that do not depend on any parameter are applied only once, to the initial
+state. The gate loop is compiled with Numba when it is installed, so that a whole
+batch of energies is a single call into compiled code. Without Numba the gates
+are applied with vectorized NumPy operations on all the statevectors of the batch
+at once.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+_RY, _RZ, _CX = 0, 1, 2
+_GATE_KINDS = {"ry": _RY, "rz": _RZ, "cx": _CX}
+
+
+def compile_ansatz(ansatz):
+    """Flatten a transpiled ansatz into the gate table used by ``ansatz_energies``.
+
+    Args:
+        ansatz: A circuit made of RY, RZ and CX gates, whose rotation angles are
+            either fixed or a single parameter of the circuit.
+
+    Returns:
+        A tuple ``(gates, angles, initial_state)``. Each row of the int64 array
+        ``gates`` is ``(kind, qubit, target, parameter index)``, where the index
+        is -1 for a fixed angle, which is then stored in the float64 array
+        ``angles``. The gates before the first parameterized one are not in the
+        table; they are already applied to the complex128 ``initial_state``.
+
+    Raises:
+        ValueError: If the circuit contains another gate or a parameter expression.
+    """
+    index = {param: i for i, param in enumerate(ansatz.parameters)}
+    gates = []
+    angles = []
+    for instruction in ansatz.data:
+        name = instruction.operation.name
+        if name == "barrier":
+            continue
+        if name not in _GATE_KINDS:
+            raise ValueError(f"gate '{name}' is not supported")
+        qubits = [ansatz.find_bit(qubit).index for qubit in instruction.qubits]
+        param_index, angle = -1, 0.0
+        if name != "cx":
+            (angle,) = instruction.operation.params
+            if angle in index:
+                param_index, angle = index[angle], 0.0
+            else:
+                try:
+                    angle = float(angle)
+                except TypeError:
+                    raise ValueError(f"angle '{angle}' is not a single parameter") from None
+        gates.append((_GATE_KINDS[name], qubits[0], qubits[-1], param_index))
+        angles.append(angle)
+    gates = np.array(gates, dtype=np.int64).reshape(-1, 4)
+    angles = np.array(angles, dtype=np.float64)
+    # the parameter-free prefix gives the same state for every parameter vector
+    parameterized = np.flatnonzero(gates[:, 3] >= 0)
+    prefix = parameterized[0] if len(parameterized) else len(gates)
+    states = np.zeros((1, 1 << ansatz.num_qubits), dtype=np.complex128)
+    states[0, 0] = 1
+    _apply_gates_numpy(states, np.empty((1, 0)), gates[:prefix], angles[:prefix])
+    return gates[prefix:], angles[prefix:], states[0]
+
+
+def _apply_gates_numpy(states, params, gates, angles):
+    batch = states.shape[0]
+    for (kind, qubit, target, param_index), angle in zip(gates, angles):
+        theta = params[:, param_index] if param_index >= 0 else np.full(batch, angle)
+        # the qubit's amplitudes are the middle axis of a (batch, high, 2, low) view
+        view = states.reshape(batch, -1, 2, 1 << qubit)
+        if kind == _RY:
+            c = np.cos(theta / 2)[:, None, None]
+            s = np.sin(theta / 2)[:, None, None]
+            zero = view[:, :, 0, :].copy()
+            view[:, :, 0, :] = c * zero - s * view[:, :, 1, :]
+            view[:, :, 1, :] = s * zero + c * view[:, :, 1, :]
+        elif kind == _RZ:
+            phase = np.exp(0.5j * theta)[:, None, None]
+            view[:, :, 0, :] *= phase.conj()
+            view[:, :, 1, :] *= phase
+        else:
+            # swap the target's amplitudes in the half of the state where the control is set
+            indices = np.arange(states.shape[1])
+            flip = indices[((indices >> qubit) & 1 == 1) & ((indices >> target) & 1 == 0)]
+            partner = flip | (1 << target)
+            states[:, flip], states[:, partner] = states[:, partner], states[:, flip].copy()
+
+
+def _energies_numpy(params, gates, angles, initial_state, hamiltonian_matrix):
+    states = np.tile(initial_state, (params.shape[0], 1))
+    _apply_gates_numpy(states, params, gates, angles)
+    return np.einsum("bi,ij,bj->b", states.conj(), hamiltonian_matrix, states).real
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _apply_gates(state, params, gates, angles):
+        for g in range(gates.shape[0]):
+            kind, qubit, target, param_index = gates[g, 0], gates[g, 1], gates[g, 2], gates[g, 3]
+            theta = params[param_index] if param_index >= 0 else angles[g]
+            stride = 1 << qubit
+            if kind == _RY:
+                c = np.cos(theta / 2)
+                s = np.sin(theta / 2)
+                for i in range(state.shape[0]):
+                    if not i & stride:
+                        a = state[i]
+                        b = state[i | stride]
+                        state[i] = c * a - s * b
+                        state[i | stride] = s * a + c * b
+            elif kind == _RZ:
+                phase = np.exp(0.5j * theta)
+                for i in range(state.shape[0]):
+                    if i & stride:
+                        state[i] *= phase
+                    else:
+                        state[i] *= np.conj(phase)
+            else:
+                flip = 1 << target
+                for i in range(state.shape[0]):
+                    if i & stride and not i & flip:
+                        state[i], state[i | flip] = state[i | flip], state[i]
+
+    @njit(parallel=True, cache=True)
+    def _energies_numba(params, gates, angles, initial_state, hamiltonian_matrix):
+        energies = np.empty(params.shape[0])
+        # the parameter vectors of a batch are independent, so they are spread over threads
+        for b in prange(params.shape[0]):
+            state = initial_state.copy()
+            _apply_gates(state, params[b], gates, angles)
+            energies[b] = np.vdot(state, hamiltonian_matrix @ state).real
+        return energies
+
+
+def ansatz_energies(params, gates, angles, initial_state, hamiltonian_matrix):
+    """Exact energies of the ansatz compiled by ``compile_ansatz``.
+
+    Args:
+        params: One parameter vector, or a 2D array with one vector per row.
+        gates: The gate table returned by ``compile_ansatz``.
+        angles: The fixed angles returned by ``compile_ansatz``.
+        initial_state: The initial state returned by ``compile_ansatz``.
+        hamiltonian_matrix: The dense complex128 matrix of the Hamiltonian.
+
+    Returns:
+        The energies, with the shape of ``params`` without its last axis.
+    """
+    params = np.asarray(params, dtype=np.float64)
+    batch = params.reshape(-1, params.shape[-1])
+    hamiltonian_matrix = np.ascontiguousarray(hamiltonian_matrix, dtype=np.complex128)
+    if njit is not None:
+        energies = _energies_numba(batch, gates, angles, initial_state, hamiltonian_matrix)
+    else:
+        energies = _energies_numpy(batch, gates, angles, initial_state, hamiltonian_matrix)
+    return energies.reshape(params.shape[:-1])